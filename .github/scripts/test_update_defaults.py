@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de update_defaults.py :
+- miners.py : fallback AST sans marqueurs, marqueurs dans le désordre ;
+- packages.py : cible non réécrite quand les valeurs sont déjà à jour.
+
+Lancer depuis la racine du dépôt :
+    python -m pytest -q .github/scripts
+"""
+from __future__ import annotations
+
+import ast
+from pathlib import Path
+
+from update_defaults import update_miners_defaults, update_packages_defaults
+
+
+def run_miners(tmp_path: Path, src: str) -> str:
+    target = tmp_path / "scanner" / "refs" / "miners.py"
+    target.parent.mkdir(parents=True)
+    target.write_text(src, encoding="utf-8")
+    assert update_miners_defaults(tmp_path, [r"new[a-z]+"], [r"\bproc\b"], [r"curl\s+[^|]+"])
+    out = target.read_text(encoding="utf-8")
+    ast.parse(out)
+    return out
+
+
+def test_fallback_closing_bracket_on_last_item_line(tmp_path: Path) -> None:
+    out = run_miners(tmp_path, (
+        'DEFAULT_MINER_FILE_HINTS = [\n'
+        '    r"xmrig",\n'
+        '    r"minerd"]\n'
+        'DEFAULT_MINER_PROC_HINTS = [\n'
+        '    r"a",\n'
+        ']\n'
+    ))
+    assert 'r"new[a-z]+"' in out
+    assert 'DEFAULT_MINER_PROC_HINTS: List[str] = [\n    r"\\bproc\\b"\n]' in out
+    assert "xmrig" not in out and 'r"a"' not in out
+
+
+def test_fallback_one_line_list_with_trailing_comment(tmp_path: Path) -> None:
+    out = run_miners(tmp_path, (
+        'DEFAULT_MINER_FILE_HINTS = ["xmrig"]  # hints\n'
+        'def f():\n'
+        '    x = [\n'
+        '1,\n'
+        ']\n'
+        '    return x\n'
+    ))
+    assert "xmrig" not in out
+    assert out.endswith(']  # hints\ndef f():\n    x = [\n1,\n]\n    return x\n')
+
+
+def test_fallback_indented_list_in_class(tmp_path: Path) -> None:
+    out = run_miners(tmp_path, (
+        'class Refs:\n'
+        '    DEFAULT_MINER_FILE_HINTS = [\n'
+        '        r"xmrig",\n'
+        '    ]\n'
+        '    other = 1\n'
+        '\n'
+        'X = [\n'
+        '1,\n'
+        ']\n'
+    ))
+    assert '    DEFAULT_MINER_FILE_HINTS: List[str] = [\n        r"new[a-z]+"\n    ]\n    other = 1\n' in out
+    assert out.endswith('X = [\n1,\n]\n')
+
+
+def test_fallback_unparsable_file_is_left_untouched(tmp_path: Path, capsys) -> None:
+    target = tmp_path / "scanner" / "refs" / "miners.py"
+    target.parent.mkdir(parents=True)
+    src = 'DEFAULT_MINER_FILE_HINTS = [\n    r"xmrig",\n'
+    target.write_text(src, encoding="utf-8")
+
+    assert not update_miners_defaults(tmp_path, ["a"], ["b"], ["c"], verbose=True)
+    assert target.read_text(encoding="utf-8") == src
+    assert "non parsable" in capsys.readouterr().out
+
+
+def test_markers_out_of_order(tmp_path: Path) -> None:
+    out = run_miners(tmp_path, (
+        '# BEGIN DEFAULT_MINER_PROC_HINTS (AUTO)\n'
+        'DEFAULT_MINER_PROC_HINTS = ["old_proc"]\n'
+        '# END DEFAULT_MINER_PROC_HINTS (AUTO)\n'
+        '# BEGIN DEFAULT_MINER_FILE_HINTS (AUTO)\n'
+        'DEFAULT_MINER_FILE_HINTS = ["old_file"]\n'
+        '# END DEFAULT_MINER_FILE_HINTS (AUTO)\n'
+    ))
+    assert "old_proc" not in out and "old_file" not in out
+    assert out.index("PROC_HINTS: List[str]") < out.index("FILE_HINTS: List[str]")
+
+
+def test_unchanged_payload_does_not_touch_target(tmp_path: Path) -> None:
+    target = tmp_path / "scanner" / "refs" / "packages.py"
+    target.parent.mkdir(parents=True)
+    target.write_text('DEFAULT_BAD_PACKAGES = {}\nDEFAULT_EXTRA_TARGETS = []\n', encoding="utf-8")
+
+    assert update_packages_defaults(tmp_path, {"pkg": ["1.0.0"]}, ["pkg"])
+    written = target.read_bytes()
+    target.with_suffix(".py.bak").unlink()
+
+    # Valeurs déjà à jour : ni réécriture ni .bak
+    assert not update_packages_defaults(tmp_path, {"pkg": ["1.0.0"]}, ["pkg"])
+    assert target.read_bytes() == written
+    assert not target.with_suffix(".py.bak").exists()
+
+    assert update_packages_defaults(tmp_path, {"pkg": ["2.0.0"]}, ["pkg"])
+    assert "2.0.0" in target.read_text(encoding="utf-8")
@@ -12,20 +12,61 @@
 from __future__ import annotations
 
 import argparse
+import ast
 import json
+import os
 import re
+import shutil
 import sys
 import tempfile
 from pathlib import Path
 from typing import Any, Iterable, Tuple
 
+try:  # Optionnel : parse JSON en C directement depuis les bytes
+    import orjson
+except ImportError:  # le workflow n'installe que la stdlib
+    orjson = None
+
+
+# ---------- Patterns DEFAULT_* (compilés une seule fois) ----------
+# Classes négatives bornées plutôt que `.*?` + DOTALL : le moteur ne peut pas
+# revenir en arrière caractère par caractère sur tout le reste du fichier.
+
+# Dict à un niveau d'imbrication : {"pkg": ["1.0.0"], ...}
+_DICT_BLOCK = r"\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}"
+# Liste de noms de paquets (pas de ']' dans les chaînes)
+_LIST_BLOCK = r"\[[^\]]*\]"
+
+# Annotation de type optionnelle : une seule passe couvre `X: List[str] = ...` et `X = ...`
+_LIST_ANNOT = r"(?:\s*:\s*List\[\s*str\s*\])?"
+
+# packages.py
+# (Les listes de regex de miners.py peuvent contenir ']' : leur fallback passe
+# par l'AST, voir replace_assignments().)
+_PAT_BAD = re.compile(r"DEFAULT_BAD_PACKAGES(?:\s*:\s*Dict\[\s*str\s*,\s*List\[\s*str\s*\]\])?\s*=\s*" + _DICT_BLOCK)
+_PAT_TARGETS = re.compile(r"DEFAULT_EXTRA_TARGETS" + _LIST_ANNOT + r"\s*=\s*" + _LIST_BLOCK)
+
 
 # ---------- Utils I/O ----------
 
+# JSON déjà parsés, indexés par (chemin absolu, mtime_ns, taille) : un fichier
+# modifié entre deux appels est relu, sinon simple lookup.
+_JSON_CACHE: dict[tuple[str, int, int], Any] = {}
+
+
 def load_json(path: Path) -> Any:
-    if not path.exists():
-        raise FileNotFoundError(f"JSON introuvable: {path}")
-    return json.loads(path.read_text(encoding="utf-8"))
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        raise FileNotFoundError(f"JSON introuvable: {path}") from None
+    with f:
+        # Clé issue du descripteur déjà ouvert : pas de stat séparé
+        st = os.fstat(f.fileno())
+        key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+        if key not in _JSON_CACHE:
+            data = f.read()
+            _JSON_CACHE[key] = orjson.loads(data) if orjson is not None else json.loads(data)
+    return _JSON_CACHE[key]
 
 
 def dumps_python(value: Any) -> str:
@@ -33,6 +74,8 @@ def dumps_python(value: Any) -> str:
     Sérialise via json.dumps pour obtenir un rendu stable et lisible.
     sort_keys=True pour des diffs Git déterministes.
     (Les chaînes JSON sont aussi valides en littéraux Python.)
+    Reste sur la stdlib : orjson n'indente qu'à 2 espaces, et ré-indenter sa
+    sortie en Python coûte plus cher que json.dumps(indent=4).
     """
     return json.dumps(value, indent=4, ensure_ascii=False, sort_keys=True)
 
@@ -55,47 +98,151 @@ def dumps_raw_list(items: list[str]) -> str:
     return "[\n    " + ",\n    ".join(out) + "\n]"
 
 
-def replace_first(src: str, patterns: Iterable[str], replacement: str) -> Tuple[str, bool, str]:
+def replace_first(src: str, pattern: re.Pattern, replacement: str) -> Tuple[str, bool]:
     """
-    Tente une suite de patterns (regex DOTALL), renvoie (nouvelle_source, changé, pattern_utilisé).
-    Le premier pattern qui matche est remplacé une seule fois (count=1).
+    Remplace la première occurrence de `pattern` (count=1), renvoie (nouvelle_source, changé).
+    Replacer callable pour ne pas interpréter les backslashes du remplacement
+    (sinon \\s, \\b, etc. cassent la substitution).
     """
-    for pat in patterns:
-        new_src, n = re.subn(pat, replacement, src, count=1, flags=re.DOTALL)
-        if n:
-            return new_src, True, pat
-    return src, False, ""
+    new_src, n = pattern.subn(lambda _m: replacement, src, count=1)
+    return new_src, bool(n)
 
 
-def replace_between_marks(src: str, begin: str, end: str, payload: str) -> tuple[str, bool]:
+def replace_assignments(src: str, payloads: dict[str, str]) -> tuple[str, list[str]]:
     """
-    Remplace le contenu entre deux marqueurs *sur une seule occurrence*.
-    Les marqueurs eux-mêmes sont conservés.
-    Utilise un replacer callable pour éviter l'interprétation des backslashes
-    dans le payload (sinon \s, \b, etc. cassent la substitution).
+    Remplace les affectations `NOM = [...]` / `NOM: T = [...]` (première occurrence
+    de chaque nom) par la déclaration fournie ; renvoie (nouvelle_source, noms_remplacés).
+    Les bornes viennent de l'AST (lineno/end_col_offset) : robuste aux ']' dans
+    les chaînes, aux commentaires en fin de ligne et aux listes indentées.
+    Les lignes suivantes du payload reprennent l'indentation de l'affectation.
+    Source non parsable → SyntaxError (à l'appelant de décider).
     """
-    pat = re.compile(rf"({re.escape(begin)})(.*?)[ \t]*({re.escape(end)})", re.DOTALL)
-
-    def replacer(m: re.Match) -> str:
-        return m.group(1) + "\n" + payload + "\n" + m.group(3)
+    tree = ast.parse(src)
+
+    found: dict[str, ast.stmt] = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and len(node.targets) == 1:
+            tgt = node.targets[0]
+        elif isinstance(node, ast.AnnAssign) and node.value is not None:
+            tgt = node.target
+        else:
+            continue
+        if not (isinstance(tgt, ast.Name) and tgt.id in payloads and isinstance(node.value, ast.List)):
+            continue
+        prev = found.get(tgt.id)
+        if prev is None or (node.lineno, node.col_offset) < (prev.lineno, prev.col_offset):
+            found[tgt.id] = node
+
+    # Début de chaque ligne (offsets en caractères) ; col_offset est en octets UTF-8
+    line_starts = [0] + [m.end() for m in re.finditer("\n", src)]
+
+    def offset(lineno: int, col: int) -> int:
+        start = line_starts[lineno - 1]
+        end = src.find("\n", start)
+        line = src[start:] if end < 0 else src[start:end]
+        return start + len(line.encode("utf-8")[:col].decode("utf-8"))
+
+    spans = []
+    for name, node in found.items():
+        begin = offset(node.lineno, node.col_offset)
+        line = src[line_starts[node.lineno - 1]:begin]
+        indent = line[:len(line) - len(line.lstrip())]
+        text = payloads[name].replace("\n", "\n" + indent)
+        spans.append((begin, offset(node.end_lineno, node.end_col_offset), text))
+
+    # Application de la fin vers le début : les offsets restants restent valides
+    for begin, end, text in sorted(spans, reverse=True):
+        src = src[:begin] + text + src[end:]
+    return src, sorted(found, key=lambda n: (found[n].lineno, found[n].col_offset))
+
+
+def replace_many_marks(src: str, triples: Iterable[tuple[str, str, str]]) -> tuple[str, int]:
+    """
+    Remplace le contenu entre chaque paire de marqueurs (begin, end, payload) ;
+    renvoie (nouvelle_source, nb_remplacés). Les marqueurs eux-mêmes sont conservés.
+    Les paires sont cherchées de gauche à droite à partir d'un curseur (un seul
+    parcours si elles sont dans l'ordre) ; une paire introuvable après le curseur
+    est recherchée depuis le début, l'ordre dans le fichier est donc libre.
+    Une paire absente est ignorée ; des blocs qui se chevauchent lèvent ValueError.
+    Marqueurs littéraux → simple str.find + découpage, pas de regex
+    (et donc aucune interprétation des backslashes du payload).
+    """
+    spans: list[tuple[int, int, str, str]] = []
+    cursor = 0
+    for begin, end, payload in triples:
+        i = src.find(begin, cursor)
+        if i < 0:
+            i = src.find(begin, 0, cursor)  # bloc placé avant le précédent
+        if i < 0:
+            continue
+        start = i + len(begin)
+        j = src.find(end, start)
+        if j < 0:
+            continue
+        spans.append((i, j, begin, payload))
+        cursor = max(cursor, j + len(end))
+    if not spans:
+        return src, 0
 
-    new_src, n = pat.subn(replacer, src, count=1)
-    return new_src, bool(n)
+    spans.sort()
+    out: list[str] = []
+    cursor = 0
+    for i, j, begin, payload in spans:
+        if i < cursor:
+            raise ValueError(f"Marqueurs imbriqués ou qui se chevauchent: {begin}")
+        out += (src[cursor:i + len(begin)], "\n", payload, "\n")
+        cursor = j
+    out.append(src[cursor:])
+    return "".join(out), len(spans)
 
 
 def write_atomic(path: Path, content: str, create_backup: bool = True) -> None:
     """
-    Écriture atomique : écrit dans un fichier temporaire puis remplace.
+    Écriture atomique et durable : écrit dans un fichier temporaire, fsync, puis remplace.
     Optionnellement, crée un .bak s'il existe déjà un fichier.
     """
     path.parent.mkdir(parents=True, exist_ok=True)
-    if create_backup and path.exists():
-        backup = path.with_suffix(path.suffix + ".bak")
-        backup.write_text(path.read_text(encoding="utf-8"), encoding="utf-8")
+    if create_backup:
+        try:
+            shutil.copyfile(path, path.with_suffix(path.suffix + ".bak"))  # copie noyau (sendfile)
+        except FileNotFoundError:
+            pass  # pas encore de fichier à sauvegarder
+    if not content.endswith("\n"):
+        content += "\n"
     with tempfile.NamedTemporaryFile("w", delete=False, encoding="utf-8", dir=str(path.parent)) as tmp:
-        tmp.write(content if content.endswith("\n") else content + "\n")
+        tmp.write(content)
+        # Données sur disque AVANT le rename, sinon un crash peut laisser une cible vide
+        tmp.flush()
+        os.fsync(tmp.fileno())
         tmp_path = Path(tmp.name)
     tmp_path.replace(path)
+    fsync_dir(path.parent)
+
+
+def fsync_dir(directory: Path) -> None:
+    """
+    Rend le rename durable (entrée de répertoire). Sans effet hors POSIX.
+    """
+    if os.name != "posix":
+        return
+    fd = os.open(str(directory), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_if_changed(path: Path, original: str, content: str, verbose: bool = False) -> bool:
+    """
+    N'écrit (et ne sauvegarde) que si le contenu diffère de la source lue.
+    Les valeurs déjà à jour ne touchent pas la cible : renvoie False.
+    """
+    if content == original:
+        if verbose:
+            print(f"[{path.name}] Contenu inchangé, aucune écriture.")
+        return False
+    write_atomic(path, content)
+    return True
 
 
 # ---------- Mises à jour concrètes ----------
@@ -106,32 +253,27 @@ def update_packages_defaults(scanner_root: Path, bad_packages: dict, extra_targe
     (Regex OK ici car pas de crochets ']' dans des chaînes.)
     """
     target = scanner_root / "scanner" / "refs" / "packages.py"
-    if not target.exists():
-        raise FileNotFoundError(f"Fichier introuvable: {target}")
-
-    src = target.read_text(encoding="utf-8")
+    try:
+        data = target.read_bytes()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Fichier introuvable: {target}") from None
 
     # Déclarations à injecter
     new_bad = f"DEFAULT_BAD_PACKAGES: Dict[str, List[str]] = {dumps_python(bad_packages)}"
     new_targets = f"DEFAULT_EXTRA_TARGETS: List[str] = {dumps_python(extra_targets)}"
 
-    # Patterns (annoté puis fallback sans annotation)
-    pat_bad_annot = r"DEFAULT_BAD_PACKAGES\s*:\s*Dict\[\s*str\s*,\s*List\[\s*str\s*\]\]\s*=\s*\{.*?\}"
-    pat_bad_plain = r"DEFAULT_BAD_PACKAGES\s*=\s*\{.*?\}"
-    pat_targets_annot = r"DEFAULT_EXTRA_TARGETS\s*:\s*List\[\s*str\s*\]\s*=\s*\[.*?\]"
-    pat_targets_plain = r"DEFAULT_EXTRA_TARGETS\s*=\s*\[.*?\]"
+    original = src = data.decode("utf-8")
 
-    src, c_bad, used_bad = replace_first(src, (pat_bad_annot, pat_bad_plain), new_bad)
+    src, c_bad = replace_first(src, _PAT_BAD, new_bad)
     if verbose and c_bad:
-        print(f"[packages.py] Remplacement DEFAULT_BAD_PACKAGES via pattern: {used_bad}")
+        print(f"[packages.py] Remplacement DEFAULT_BAD_PACKAGES via pattern: {_PAT_BAD.pattern}")
 
-    src, c_targets, used_targets = replace_first(src, (pat_targets_annot, pat_targets_plain), new_targets)
+    src, c_targets = replace_first(src, _PAT_TARGETS, new_targets)
     if verbose and c_targets:
-        print(f"[packages.py] Remplacement DEFAULT_EXTRA_TARGETS via pattern: {used_targets}")
+        print(f"[packages.py] Remplacement DEFAULT_EXTRA_TARGETS via pattern: {_PAT_TARGETS.pattern}")
 
     if c_bad or c_targets:
-        write_atomic(target, src)
-        return True
+        return write_if_changed(target, original, src, verbose)
     return False
 
 
@@ -148,21 +290,23 @@ def update_miners_defaults(
     - DEFAULT_MINER_PROC_HINTS
     - DEFAULT_SUSPICIOUS_SCRIPT_PATTERNS
 
-    ⚠️ D'abord via MARQUEURS (plus sûr), sinon fallback regex.
+    ⚠️ D'abord via MARQUEURS (plus sûr), sinon fallback AST.
     """
     target = scanner_root / "scanner" / "refs" / "miners.py"
-    if not target.exists():
+    try:
+        data = target.read_bytes()
+    except FileNotFoundError:
         if verbose:
             print(f"[miners.py] Absent, aucun changement.")
         return False
 
-    src = target.read_text(encoding="utf-8")
-
     # Payloads (miners en littéraux r"...")
     new_file = f"DEFAULT_MINER_FILE_HINTS: List[str] = {dumps_raw_list(file_hints)}"
     new_proc = f"DEFAULT_MINER_PROC_HINTS: List[str] = {dumps_raw_list(proc_hints)}"
     new_scr  = f"DEFAULT_SUSPICIOUS_SCRIPT_PATTERNS: List[str] = {dumps_raw_list(script_patterns)}"
 
+    src = data.decode("utf-8")
+
     # Marqueurs attendus dans miners.py
     m_file_begin = "# BEGIN DEFAULT_MINER_FILE_HINTS (AUTO)"
     m_file_end   = "# END DEFAULT_MINER_FILE_HINTS (AUTO)"
@@ -171,43 +315,38 @@ def update_miners_defaults(
     m_scr_begin  = "# BEGIN DEFAULT_SUSPICIOUS_SCRIPT_PATTERNS (AUTO)"
     m_scr_end    = "# END DEFAULT_SUSPICIOUS_SCRIPT_PATTERNS (AUTO)"
 
-    # 1) Tentative par marqueurs
-    src2, c1 = replace_between_marks(src, m_file_begin, m_file_end, new_file)
-    src3, c2 = replace_between_marks(src2, m_proc_begin, m_proc_end, new_proc)
-    src4, c3 = replace_between_marks(src3, m_scr_begin, m_scr_end, new_scr)
+    # 1) Tentative par marqueurs (un seul parcours pour les trois blocs)
+    src2, n_marks = replace_many_marks(src, (
+        (m_file_begin, m_file_end, new_file),
+        (m_proc_begin, m_proc_end, new_proc),
+        (m_scr_begin, m_scr_end, new_scr),
+    ))
 
-    if c1 or c2 or c3:
+    if n_marks:
         if verbose:
-            print(f"[miners.py] Remplacement via MARQUEURS: file={c1}, proc={c2}, scr={c3}")
-        write_atomic(target, src4)
-        return True
+            print(f"[miners.py] Remplacement via MARQUEURS: {n_marks}/3 bloc(s)")
+        return write_if_changed(target, src, src2, verbose)
 
-    # 2) Fallback regex si pas de marqueurs
+    # 2) Fallback AST si pas de marqueurs (les regex peuvent contenir ']')
     if verbose:
-        print("[miners.py] Marqueurs absents → fallback regex (moins sûr).")
-
-    pat_file_annot = r"DEFAULT_MINER_FILE_HINTS\s*:\s*List\[\s*str\s*\]\s*=\s*\[.*?\]"
-    pat_file_plain = r"DEFAULT_MINER_FILE_HINTS\s*=\s*\[.*?\]"
-    pat_proc_annot = r"DEFAULT_MINER_PROC_HINTS\s*:\s*List\[\s*str\s*\]\s*=\s*\[.*?\]"
-    pat_proc_plain = r"DEFAULT_MINER_PROC_HINTS\s*=\s*\[.*?\]"
-    pat_scr_annot  = r"DEFAULT_SUSPICIOUS_SCRIPT_PATTERNS\s*:\s*List\[\s*str\s*\]\s*=\s*\[.*?\]"
-    pat_scr_plain  = r"DEFAULT_SUSPICIOUS_SCRIPT_PATTERNS\s*=\s*\[.*?\]"
-
-    src, c1, u1 = replace_first(src, (pat_file_annot, pat_file_plain), new_file)
-    if verbose and c1:
-        print(f"[miners.py] Remplacement DEFAULT_MINER_FILE_HINTS via pattern: {u1}")
-
-    src, c2, u2 = replace_first(src, (pat_proc_annot, pat_proc_plain), new_proc)
-    if verbose and c2:
-        print(f"[miners.py] Remplacement DEFAULT_MINER_PROC_HINTS via pattern: {u2}")
-
-    src, c3, u3 = replace_first(src, (pat_scr_annot, pat_scr_plain), new_scr)
-    if verbose and c3:
-        print(f"[miners.py] Remplacement DEFAULT_SUSPICIOUS_SCRIPT_PATTERNS via pattern: {u3}")
-
-    if c1 or c2 or c3:
-        write_atomic(target, src)
-        return True
+        print("[miners.py] Marqueurs absents → fallback AST (moins sûr).")
+
+    try:
+        src2, replaced = replace_assignments(src, {
+            "DEFAULT_MINER_FILE_HINTS": new_file,
+            "DEFAULT_MINER_PROC_HINTS": new_proc,
+            "DEFAULT_SUSPICIOUS_SCRIPT_PATTERNS": new_scr,
+        })
+    except SyntaxError as e:
+        if verbose:
+            print(f"[miners.py] Fichier non parsable (ligne {e.lineno}: {e.msg}), aucun changement.")
+        return False
+    if verbose:
+        for name in replaced:
+            print(f"[miners.py] Remplacement {name} via AST")
+
+    if replaced:
+        return write_if_changed(target, src, src2, verbose)
     return False
 
 